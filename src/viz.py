@@ -1,15 +1,57 @@
 # src/viz.py
 from __future__ import annotations
+import numpy as np
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import plotly.express as px
 
-# 配置中文字体（macOS 系统字体）
-plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'Heiti TC', 'SimHei', 'DejaVu Sans']
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+# seaborn / matplotlib / plotly 导入较慢，放到各函数内按需导入（--no-plots 时不加载）
+_configured = False
+# 按 figsize 缓存 (fig, ax)，仅在 fresh=False 时使用（批量/循环出图时复用，避免每次新建 Figure）
+_FIG_CACHE: dict = {}
 
-def plot_sales_vs_ads_static(df: pd.DataFrame, x: str = "ad_spend", y: str = "sales"):
+def _pyplot():
+    """导入 pyplot，并在首次调用时配置中文字体。"""
+    global _configured
+    import matplotlib.pyplot as plt
+    if not _configured:
+        # 配置中文字体（macOS 系统字体）
+        plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'Heiti TC', 'SimHei', 'DejaVu Sans']
+        plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+        _configured = True
+    return plt
+
+def linear_fit(df: pd.DataFrame, x: str = "ad_spend", y: str = "sales"):
+    """
+    用 np.polyfit 做一次最小二乘直线拟合（忽略缺失值与 ±inf）。
+    只用于画趋势线，直接按 float32 取数，精度足够。
+    
+    返回：
+        (slope, intercept, x_min, x_max)；有效数据点少于 2 个或拟合不收敛时返回 None
+    """
+    xv = df[x].to_numpy(dtype=np.float32, na_value=np.nan)
+    yv = df[y].to_numpy(dtype=np.float32, na_value=np.nan)
+    mask = np.isfinite(xv) & np.isfinite(yv)
+    xv, yv = xv[mask], yv[mask]
+    if len(xv) < 2:
+        return None
+    try:
+        m, b = np.polyfit(xv, yv, 1)
+    except np.linalg.LinAlgError:
+        return None
+    return float(m), float(b), float(xv.min()), float(xv.max())
+
+def _trend_line(df: pd.DataFrame, x: str, y: str, fit=None):
+    """
+    趋势线两端点坐标 (xs, ys)；未传入 fit 时现算，无法拟合时返回 None。
+    """
+    if fit is None:
+        fit = linear_fit(df, x, y)
+        if fit is None:
+            return None
+    m, b, x_min, x_max = fit
+    xs = np.array([x_min, x_max])
+    return xs, m * xs + b
+
+def plot_sales_vs_ads_static(df: pd.DataFrame, x: str = "ad_spend", y: str = "sales", *, fresh: bool = True, fit=None):
     """
     静态散点图（Seaborn + Matplotlib）。在 Jupyter 中直接显示。
     
@@ -17,6 +59,9 @@ def plot_sales_vs_ads_static(df: pd.DataFrame, x: str = "ad_spend", y: str = "sa
         df: 包含 x 和 y 列的 DataFrame
         x: x 轴列名（默认："ad_spend"）
         y: y 轴列名（默认："sales"）
+        fresh: 默认 True，每次新建 Figure；批量/循环出图可传 False 复用缓存的 Figure
+               （注意：此时上一次返回的 Figure 会被清空重画）
+        fit: 可选，linear_fit() 的结果 (slope, intercept, x_min, x_max)，传入则不再重复扫描数据
     
     返回：
         matplotlib.figure.Figure: 图表对象
@@ -28,17 +73,30 @@ def plot_sales_vs_ads_static(df: pd.DataFrame, x: str = "ad_spend", y: str = "sa
     if x not in df.columns or y not in df.columns:
         raise ValueError(f"DataFrame 缺少列: {x} 或 {y}")
     
-    fig, ax = plt.subplots(figsize=(10, 6))
+    import seaborn as sns
+    plt = _pyplot()
+    figsize = (10, 6)
+    if fresh:
+        fig, ax = plt.subplots(figsize=figsize)
+    else:
+        if figsize not in _FIG_CACHE:
+            _FIG_CACHE[figsize] = plt.subplots(figsize=figsize)
+        fig, ax = _FIG_CACHE[figsize]
+        ax.clear()
     sns.scatterplot(data=df, x=x, y=y, ax=ax, s=100, alpha=0.7)
-    sns.regplot(data=df, x=x, y=y, ax=ax, scatter=False, line_kws={'color': 'red', 'linewidth': 2})
+    # 直接用 polyfit 画趋势线，省去 regplot 的 bootstrap 置信带
+    line = _trend_line(df, x, y, fit)
+    if line is not None:
+        ax.plot(*line, color='red', linewidth=2)
     ax.set_title("广告投入与销量关系（静态）", fontsize=14, fontweight='bold')
     ax.set_xlabel(f"{x} (万元)", fontsize=12)
     ax.set_ylabel(f"{y} (万元)", fontsize=12)
     ax.grid(True, alpha=0.3)
-    plt.tight_layout()
+    # 固定边距代替 tight_layout，避免保存前多一次布局计算
+    fig.subplots_adjust(left=0.1, right=0.95, top=0.92, bottom=0.12)
     return fig
 
-def plot_sales_vs_ads_interactive(df: pd.DataFrame, x: str = "ad_spend", y: str = "sales"):
+def plot_sales_vs_ads_interactive(df: pd.DataFrame, x: str = "ad_spend", y: str = "sales", *, fit=None):
     """
     交互式散点图（Plotly）。返回 Plotly Figure 对象。
     
@@ -46,6 +104,7 @@ def plot_sales_vs_ads_interactive(df: pd.DataFrame, x: str = "ad_spend", y: str
         df: 包含 x、y 和 month 列的 DataFrame
         x: x 轴列名（默认："ad_spend"）
         y: y 轴列名（默认："sales"）
+        fit: 可选，linear_fit() 的结果 (slope, intercept, x_min, x_max)，传入则不再重复扫描数据
     
     返回：
         plotly.graph_objs._figure.Figure: 交互式图表对象
@@ -57,11 +116,25 @@ def plot_sales_vs_ads_interactive(df: pd.DataFrame, x: str = "ad_spend", y: str
     if x not in df.columns or y not in df.columns:
         raise ValueError(f"DataFrame 缺少列: {x} 或 {y}")
     
-    fig = px.scatter(
-        df, x=x, y=y,
-        size=y,
-        hover_name="month" if "month" in df.columns else None,
-        title="广告投入与销量关系（交互式）",
-        trendline="ols"
-    )
+    import plotly.graph_objects as go
+    # 直接用 graph_objects 构图：不经过 plotly.express 的 DataFrame 拷贝，也不引入 statsmodels
+    y_max = df[y].max()
+    size = df[y] / y_max * 40 if y_max and y_max > 0 else 10
+    has_month = "month" in df.columns
+    fig = go.Figure(layout={
+        "title": {"text": "广告投入与销量关系（交互式）"},
+        "xaxis": {"title": {"text": x}},
+        "yaxis": {"title": {"text": y}},
+    })
+    fig.add_trace(go.Scatter(
+        x=df[x], y=df[y],
+        mode="markers",
+        marker=dict(size=size, sizemode="diameter"),
+        hovertext=df["month"] if has_month else None,
+        hovertemplate=("<b>%{hovertext}</b><br>" if has_month else "") + f"{x}=%{{x}}<br>{y}=%{{y}}<extra></extra>",
+        showlegend=False,
+    ))
+    line = _trend_line(df, x, y, fit)
+    if line is not None:
+        fig.add_trace(go.Scatter(x=line[0], y=line[1], mode="lines", name="OLS trendline", showlegend=False))
     return fig
\ No newline at end of file